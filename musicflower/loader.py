@@ -1,17 +1,24 @@
 #  Copyright (c) Robert Lieck 2022.
 
 import os
+import sys
+import stat
+import json
 import pickle
+import pickletools
+import importlib
+import tempfile
 from typing import Iterable, Tuple, Union, Dict
-from itertools import product
+from itertools import islice
+from functools import lru_cache, partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pathlib
 from warnings import warn
 
-from musicflower import istarmap # patch Pool
-from multiprocessing import Pool
 from tqdm import tqdm
 import numpy as np
 import scipy
+from numba import njit
 
 import librosa
 import librosa.display
@@ -21,22 +28,223 @@ import pitchscapes.reader as rd
 from triangularmap import TMap
 
 
-def get_cache_file_path(file_path: Union[str, pathlib.Path], n: int, remove_extension: bool = False):
+def get_cache_file_path(file_path: Union[str, pathlib.Path], n: int, remove_extension: bool = False,
+                        extension: str = ".npy"):
     """
     For a given file path and resolution, return the associated cache file path, which corresponds to the original file
-    path appended with `_<n>.pickle`, where `<n>` is replaced with the actual resolution.
+    path appended with `_<n>.npy`, where `<n>` is replaced with the actual resolution.
 
     :param file_path: path to the original file
     :param n: resolution of the pitch scape
-    :param remove_extension: remove the original file extension before appending `_<n>.pickle` (if the same file is used
+    :param remove_extension: remove the original file extension before appending `_<n>.npy` (if the same file is used
      with different extensions, for instance, \*.mxl for a MusicXML file and \*.ogg for an associated audio file,
      removing the extension leads to name conflicts for the cache files)
+    :param extension: extension of the cache file; the pitch scape is stored in a `.npy` file with an associated `.json`
+     file for the metadata; `.pickle` is used for the legacy format (and for metadata that cannot be stored as JSON)
     :return: path to the cache file
     """
     if remove_extension:
-        return os.path.splitext(file_path)[0] + f"_n{n}.pickle"
+        return os.path.splitext(file_path)[0] + f"_n{n}{extension}"
     else:
-        return pathlib.Path(str(file_path) + f"_n{n}.pickle")
+        return pathlib.Path(str(file_path) + f"_n{n}{extension}")
+
+
+def _json_normalise(kwargs: dict) -> dict:
+    """
+    Return kwargs as they would be restored from a JSON file (e.g. tuples become lists) so they can be compared to
+    cached kwargs; kwargs that cannot be stored as JSON are returned unchanged.
+    """
+    try:
+        return json.loads(json.dumps(kwargs))
+    except TypeError:
+        return kwargs
+
+
+def _load_cache(file_path: Union[str, pathlib.Path], n: int) -> Union[Tuple[np.ndarray, dict, bool], None]:
+    """
+    Load a cached pitch scape, the kwargs it was computed with, and its ordering. The pitch scape is memory-mapped
+    (read-only) from the `.npy` cache file; if that does not exist, the legacy `.pickle` cache file is tried.
+
+    :param file_path: path to the original file
+    :param n: resolution of the pitch scape
+    :return: tuple with pitch scape, kwargs, and whether it is in top-down order or None if no (complete) cache file
+     exists
+    """
+    try:
+        pdc = np.load(get_cache_file_path(file_path, n), mmap_mode='r')
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            with open(get_cache_file_path(file_path, n, extension=".json"), 'r') as meta_file:
+                meta = json.load(meta_file)
+            return pdc, meta['kwargs'], meta['top_down']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            # incomplete cache (e.g. interrupted write)
+            return None
+    try:
+        with open(get_cache_file_path(file_path, n, extension=".pickle"), 'rb') as cache_file:
+            cached = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    # legacy files without ordering flag are in start-end order
+    if len(cached) == 2:
+        cached = cached + (False,)
+    # legacy files may be in double precision
+    pdc, kwargs, top_down = cached
+    return pdc.astype(np.float32, copy=False), kwargs, top_down
+
+
+def _remove_if_exists(file_path: Union[str, pathlib.Path]) -> None:
+    """
+    Remove a file, ignoring files that do not exist.
+    """
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def _replace_file(file_path: Union[str, pathlib.Path], write: callable, mode: str = 'wb') -> None:
+    """
+    Write a file via a temporary file in the same directory, which then replaces *file_path* atomically. Readers
+    never see a partially written file and arrays memory-mapped from the old file remain valid.
+
+    :param file_path: path of the file to write
+    :param write: function that takes an open file object and writes the content
+    :param mode: mode for opening the temporary file
+    """
+    directory, name = os.path.split(file_path)
+    fd, temp_file_path = tempfile.mkstemp(dir=directory or None, prefix=name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as file:
+            write(file)
+        os.replace(temp_file_path, file_path)
+    except BaseException:
+        _remove_if_exists(temp_file_path)
+        raise
+
+
+def _save_cache(file_path: Union[str, pathlib.Path], n: int, pdc: np.ndarray, kwargs: dict, top_down: bool,
+                optimize: bool = True) -> None:
+    """
+    Store a pitch scape, the kwargs it was computed with, and its ordering in cache files. The pitch scape is stored in
+    a `.npy` file and the metadata in an associated `.json` file. If the kwargs cannot be stored as JSON, the legacy
+    `.pickle` format is used instead. Files are replaced atomically (see :func:`~musicflower.loader._replace_file`).
+
+    :param file_path: path to the original file
+    :param n: resolution of the pitch scape
+    :param pdc: pitch scape
+    :param kwargs: kwargs used to compute the pitch scape
+    :param top_down: whether the pitch scape is in top-down order
+    :param optimize: optimise the pickled data with :func:`pickletools.optimize` (slower to write, faster to read);
+     only relevant for the legacy `.pickle` format
+    """
+    cache_file_name = get_cache_file_path(file_path, n)
+    # remove cached colours, which may not match the new pitch scape
+    _remove_if_exists(get_cache_file_path(file_path, n, extension="_colors.npy"))
+    try:
+        meta = json.dumps(dict(kwargs=kwargs, top_down=top_down))
+    except TypeError:
+        # remove cache file in new format so it does not shadow the legacy file
+        _remove_if_exists(cache_file_name)
+        pickled = pickle.dumps((pdc, kwargs, top_down), protocol=pickle.HIGHEST_PROTOCOL)
+        if optimize:
+            pickled = pickletools.optimize(pickled)
+        _replace_file(get_cache_file_path(file_path, n, extension=".pickle"), lambda file: file.write(pickled))
+    else:
+        meta_file_name = get_cache_file_path(file_path, n, extension=".json")
+        # remove old metadata first, so an interrupted write leaves an incomplete cache (which is ignored) instead of
+        # a new pitch scape with old metadata
+        _remove_if_exists(meta_file_name)
+        _replace_file(cache_file_name, lambda file: np.save(file, pdc))
+        _replace_file(meta_file_name, lambda file: file.write(meta), mode='w')
+
+
+def _load_colors_cache(file_path: Union[str, pathlib.Path], n: int) -> Union[np.ndarray, None]:
+    """
+    Load cached colours (8 bit RGB in top-down order) for a pitch scape.
+
+    :param file_path: path to the original file
+    :param n: resolution of the pitch scape
+    :return: array of shape (k, 3) with colours or None if no cache file exists
+    """
+    try:
+        return np.load(get_cache_file_path(file_path, n, extension="_colors.npy"), mmap_mode='r')
+    except FileNotFoundError:
+        return None
+
+
+def _save_colors_cache(file_path: Union[str, pathlib.Path], n: int, colors: np.ndarray) -> None:
+    """
+    Store colours (8 bit RGB in top-down order) for a pitch scape in a cache file (replaced atomically, see
+    :func:`~musicflower.loader._replace_file`).
+
+    :param file_path: path to the original file
+    :param n: resolution of the pitch scape
+    :param colors: array of shape (k, 3) with colours
+    """
+    _replace_file(get_cache_file_path(file_path, n, extension="_colors.npy"), lambda file: np.save(file, colors))
+
+
+@lru_cache(maxsize=64)
+def _scape_start_end(n: int, top_down: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For a triangular map of resolution *n*, return the start and end time interval indices of all points. Results are
+    cached and returned as read-only arrays.
+
+    :param n: resolution of the triangular map
+    :param top_down: use top-down order (as used by the :class:`TMap` class); if `False` the start-to-end convention
+     from the `pitchscapes` library is used
+    :return: starts, ends: integer arrays of length :math:`n(n+1)/2`
+    """
+    idx = np.arange(TMap.size_from_n(n))
+    if top_down:
+        depth = np.repeat(np.arange(n), np.arange(1, n + 1))
+        starts = idx - depth * (depth + 1) // 2
+        ends = starts + n - depth
+    else:
+        starts = np.repeat(np.arange(n), np.arange(n, 0, -1))
+        ends = idx - (starts * n - starts * (starts - 1) // 2) + starts + 1
+    starts.flags.writeable = False
+    ends.flags.writeable = False
+    return starts, ends
+
+
+@lru_cache(maxsize=64)
+def _reindex(n: int, to_top_down: bool) -> np.ndarray:
+    """
+    Cached (read-only) version of :meth:`TMap.get_reindex_from_start_end_to_top_down` (if `to_top_down` is `True`)
+    and :meth:`TMap.get_reindex_from_top_down_to_start_end` (otherwise).
+
+    :param n: resolution of the triangular map
+    :param to_top_down: reindex from start-end to top-down order (or vice versa)
+    :return: index array of length :math:`n(n+1)/2`
+    """
+    if to_top_down:
+        idx = TMap.get_reindex_from_start_end_to_top_down(n)
+    else:
+        idx = TMap.get_reindex_from_top_down_to_start_end(n)
+    idx.flags.writeable = False
+    return idx
+
+
+# Numba kernels in this package are compiled without parallel=True: audio_scape and key_colors are called from the web
+# app's server threads, and with Numba's workqueue threading layer, concurrent calls to parallel kernels abort the
+# process (serial kernels also keep forking worker processes in load_corpus safe)
+@njit(cache=True)
+def _build_scape(cumulative: np.ndarray, starts: np.ndarray, ends: np.ndarray, out: np.ndarray) -> None:
+    """
+    Fill *out* with the sums of chroma between the given start and end time intervals.
+
+    :param cumulative: array of shape (n + 1, 12) with cumulative sums of chroma (starting with zeros)
+    :param starts: start indices of the points (see :func:`~musicflower.loader._scape_start_end`)
+    :param ends: end indices of the points (see :func:`~musicflower.loader._scape_start_end`)
+    :param out: array of shape (k, 12) to be filled, where :math:`k=n(n+1)/2`
+    """
+    for idx in range(out.shape[0]):
+        for c in range(out.shape[1]):
+            out[idx, c] = cumulative[ends[idx], c] - cumulative[starts[idx], c]
 
 
 def audio_scape(n_time_intervals: int,
@@ -54,7 +262,7 @@ def audio_scape(n_time_intervals: int,
     :param normalise: normalise the pitch class distributions
     :param top_down: use top-down order
     :param kwargs: kwargs passed on to the :func:`~musicflower.loader.get_chroma` function
-    :return: array with pitch scape
+    :return: array with pitch scape (single precision; the cumulative sums are computed in double precision)
     """
     # get chroma
     if raw_chroma is None:
@@ -63,24 +271,19 @@ def audio_scape(n_time_intervals: int,
         if data is not None:
             warn("'data' was provided but will be ignored because 'raw_chroma' was also provided", RuntimeWarning)
     n_bins = raw_chroma.shape[1]
-    # sum over specified time intervals
-    chroma = np.zeros((n_time_intervals, 12))
-    for idx in range(n_time_intervals):
-        start = int(round(idx / n_time_intervals * n_bins))
-        end = int(round((idx + 1) / n_time_intervals * n_bins))
-        chroma[idx, :] = raw_chroma[:, start:end].sum(axis=1)
-    # recursively build scape
-    scape = [chroma]
-    current_level = chroma
-    for idx in range(n_time_intervals):
-        next_level = current_level[:-1] + chroma[idx + 1:]
-        scape.append(next_level)
-        current_level = next_level
-    # reverse (because was constructed bottom-up not top-down) and concatenate
-    flattened = np.concatenate(list(reversed(scape)))
-    # change to ordering used by pitchscapes library
-    if not top_down:
-        flattened = flattened[TMap.get_reindex_from_top_down_to_start_end(TMap.n_from_size(flattened.shape[0])), ...]
+    if n_time_intervals == n_bins:
+        # each time interval corresponds to exactly one bin (e.g. pre-extracted features in the web app)
+        chroma = raw_chroma.T.astype(float)
+    else:
+        # sum over specified time intervals (empty intervals are set to zero, reduceat would return the next value)
+        bin_bounds = np.round(np.arange(n_time_intervals + 1) / n_time_intervals * n_bins).astype(int)
+        chroma = np.add.reduceat(raw_chroma, np.minimum(bin_bounds[:-1], n_bins - 1), axis=1, dtype=float).T
+        chroma[bin_bounds[:-1] == bin_bounds[1:]] = 0
+    # build scape as differences of cumulative sums (directly in requested order)
+    cumulative = np.concatenate([np.zeros((1, 12)), np.cumsum(chroma, axis=0)])
+    starts, ends = _scape_start_end(n_time_intervals, top_down=top_down)
+    flattened = np.empty((len(starts), 12), dtype=np.float32)
+    _build_scape(cumulative, starts, ends, flattened)
     # normalise
     if normalise:
         flattened /= flattened.sum(axis=1, keepdims=True)
@@ -88,7 +291,7 @@ def audio_scape(n_time_intervals: int,
 
 
 def load_file(data: str, n: int, use_cache=False, recompute_cache=False, audio=None,
-              audio_ext=(".wav", ".mp3", ".ogg"), top_down=True, **kwargs) -> np.ndarray:
+              audio_ext=(".wav", ".mp3", ".ogg"), top_down=True, optimize_cache=True, **kwargs) -> np.ndarray:
     """
     Reads a single file and computes its pitch scape with resolution *n*.
 
@@ -99,18 +302,24 @@ def load_file(data: str, n: int, use_cache=False, recompute_cache=False, audio=N
      checked for consistency; an error is raised if they do not match the provided **kwargs**. If **use_cache** is
      `True` and a cache file exists, the cached result is loaded (after checking **kwargs** for consistency) and
      returned; if the cache file does not exist, the result is computed and stored in a newly created cache file. This
-     behaviour can be changed by using **recompute_cache**.
+     behaviour can be changed by using **recompute_cache**. Cached pitch scapes are memory-mapped, so the
+     returned array may be a read-only view of the cache file.
     :param recompute_cache: if caching is used, always recompute the result and overwrite potentially existing cache
      files
     :param audio: specifies that this is an audio file (**audio_ext** is ignored)
     :param audio_ext: assumes all files with an extension in this list to be audio files, all other files to be symbolic
     :param top_down: use the top-down ordering for flattening the triangular map (as used by the :class:`TMap` class);
      if `False` the start-to-end convention from the `pitchscapes` library is used
+    :param optimize_cache: optimise cache files written in the legacy `.pickle` format (used if **kwargs** cannot be
+     stored as JSON) with :func:`pickletools.optimize`, which makes writing slower but reading faster
     :param kwargs: kwargs to passed to the :meth:`pitchscapes.reader.sample_scape` function of the pitchscapes library
      (for symbolic data) or the :func:`~musicflower.loader.audio_scape` function (for audio data);
      by default `normalise=True` is injected into kwargs, but this is overwritten by an explicitly specified value
     :rtype: np.ndarray
-    :return: array of shape (k , 12), where :math:`k=n(n+1)/2`
+    :return: array of shape (k , 12), where :math:`k=n(n+1)/2`, with single precision
+    :raises FileNotFoundError: if **data** is a path that does not exist
+    :raises ValueError: if **data** is a path that is not a regular file or cannot be read; note that a directory
+     raises a `ValueError` (not a `FileNotFoundError` as in earlier versions)
     """
     # normalise by default
     kwargs = {**dict(normalise=True), **kwargs}
@@ -120,60 +329,129 @@ def load_file(data: str, n: int, use_cache=False, recompute_cache=False, audio=N
     if data is None:
         raise ValueError('data is None')
     if not isinstance(data, tuple):
-        if not os.path.isfile(data):
-            print(os.getcwd())
-            raise FileNotFoundError(f'File {data} was not found')
+        try:
+            file_stat = os.stat(data)
+        except FileNotFoundError:
+            raise FileNotFoundError(f'File {data} was not found (working directory: {os.getcwd()})') from None
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise ValueError(f'File {data} is not a file')
         if not os.access(data, os.R_OK):
             raise ValueError(f'File {data} could not be read. Please verify permissions.')
-        if not os.path.isfile(data):
-            raise ValueError(f'File {data} is not a file')
 
-    # get cache file
-    if use_cache:
-        cache_file_name = get_cache_file_path(data, n)
-        cache_file_exists = os.path.exists(cache_file_name)
-    else:
-        cache_file_name = None
-        cache_file_exists = None
-
-    # load from cache or compute from scratch
-    if use_cache and cache_file_exists and not recompute_cache:
-        with open(cache_file_name, 'rb') as cache_file:
-            pdc, cached_kwargs = pickle.load(cache_file)
-        if not cached_kwargs == kwargs:
-            raise ValueError(f"provided sample_scape_kwargs are different from cache file:\n"
-                             f"    provided: {kwargs}\n"
-                             f"    cache file: {cached_kwargs}\n"
-                             f"Use recompute_cache=True to recompute and overwrite")
-    else:
+    # load from cache
+    pdc = None
+    if use_cache and not recompute_cache:
+        cached = _load_cache(data, n)
+        if cached is not None:
+            pdc, cached_kwargs, pdc_top_down = cached
+            if not cached_kwargs == _json_normalise(kwargs):
+                raise ValueError(f"provided sample_scape_kwargs are different from cache file:\n"
+                                 f"    provided: {kwargs}\n"
+                                 f"    cache file: {cached_kwargs}\n"
+                                 f"Use recompute_cache=True to recompute and overwrite")
+    # compute from scratch
+    if pdc is None:
         if audio or isinstance(data, tuple) or (audio is None and str(data).endswith(audio_ext)):
+            # directly computed in requested order
             pdc = audio_scape(n_time_intervals=n,
                               data=data,
+                              top_down=top_down,
                               **kwargs)
+            pdc_top_down = top_down
         else:
             pdc = rd.sample_scape(n_time_intervals=n,
                                   file_path=data,
-                                  **kwargs)
+                                  **kwargs).astype(np.float32)
+            pdc_top_down = False
         if use_cache:
-            with open(cache_file_name, 'wb') as cache_file:
-                pickle.dump((pdc, kwargs), cache_file)
+            _save_cache(data, n, pdc, kwargs, pdc_top_down, optimize=optimize_cache)
 
-    if top_down:
-        return pdc[TMap.get_reindex_from_start_end_to_top_down(TMap.n_from_size(pdc.shape[0])), ...]
-    else:
-        return pdc
+    # reindex if necessary
+    if top_down != pdc_top_down:
+        pdc = pdc[_reindex(TMap.n_from_size(pdc.shape[0]), to_top_down=top_down), ...]
+    return pdc
+
+
+# kwargs for load_file in worker processes (set by _init_worker)
+_worker_kwargs = None
+
+
+def _parallel_load_file_wrapper(file_name):
+    """
+    Wrapper for parallelisation; calls :meth:`~musicflower.loader.load_file` with the kwargs that were provided to the
+    worker process on initialisation.
+    """
+    return load_file(file_name, **_worker_kwargs)
 
 
-def _parallel_load_file_wrapper(file_name, kwargs):
+def _init_worker(kwargs):
     """
-    Wrapper for parallelisation; takes kwargs provided as dict and unpacks them when calling
-    :meth:`~musicflower.loader.load_file`.
+    Initialiser for worker processes; stores the kwargs for :meth:`~musicflower.loader.load_file` (so they are only
+    sent once per worker, not with every task) and loads librosa's (lazily loaded) submodules once per worker instead
+    of in the first task.
     """
-    return file_name, load_file(file_name, **kwargs)
+    global _worker_kwargs
+    _worker_kwargs = kwargs
+    for module in ['librosa.feature', 'librosa.effects', 'librosa.decompose']:
+        importlib.import_module(module)
+
+
+def _data_size(data) -> int:
+    """
+    Estimate the processing cost for a file path or a tuple with audio data (see :func:`~musicflower.loader.get_chroma`)
+    via the file size or number of samples, respectively.
+    """
+    if isinstance(data, tuple):
+        return np.size(data[0])
+    try:
+        return os.path.getsize(data)
+    except OSError:
+        # let load_file report the problem
+        return 0
+
+
+def _corpus_colors(corpus: np.ndarray, data: list, n: int, top_down: bool = True, use_cache: bool = False,
+                   recompute_cache: bool = False) -> np.ndarray:
+    """
+    Get colours for a corpus of pitch scapes. Colours missing from the cache are computed in a single batch via
+    :func:`~musicflower.plotting.key_colors` and quantised to 8 bit (so cached and newly computed colours are
+    identical).
+
+    :param corpus: array of shape (k, l, 12) as returned by :meth:`~musicflower.loader.load_corpus`
+    :param data: file paths or tuples with audio data corresponding to the pitch scapes in **corpus**
+    :param n: resolution of the pitch scapes
+    :param top_down: whether the pitch scapes are in top-down order
+    :param use_cache: whether to use/reuse cached colours (see :meth:`~musicflower.loader.load_file`)
+    :param recompute_cache: always recompute colours and overwrite potentially existing cache files
+    :return: array of shape (k, l, 3) with 8 bit RGB colours
+    """
+    # import here to avoid loading the plotting stack (plotly, matplotlib etc.) with the loader
+    from musicflower.plotting import key_colors
+    colors = np.empty(corpus.shape[:-1] + (3,), dtype=np.uint8)
+    use_cache = [use_cache and not isinstance(d, tuple) for d in data]
+    # load from cache (stored in top-down order)
+    missing = []
+    for idx, (file_name, cache) in enumerate(zip(data, use_cache)):
+        cached = _load_colors_cache(file_name, n) if cache and not recompute_cache else None
+        if cached is None:
+            missing.append(idx)
+        elif top_down:
+            colors[idx] = cached
+        else:
+            colors[idx] = cached[_reindex(n, to_top_down=False)]
+    # compute missing colours in one batch
+    if missing:
+        colors[missing] = np.round(key_colors(corpus[missing]) * 255)
+        for idx in missing:
+            if use_cache[idx]:
+                c = colors[idx] if top_down else colors[idx][_reindex(n, to_top_down=True)]
+                _save_colors_cache(data[idx], n, c)
+    return colors
 
 
 def load_corpus(data: Iterable, n: int, parallel: bool = False, sort_func: callable = lambda x: x,
-                **kwargs) -> Tuple[np.ndarray, list]:
+                return_colors: bool = False, **kwargs) -> Union[Tuple[np.ndarray, list],
+                                                                Tuple[np.ndarray, np.ndarray, list]]:
     """
     This is essentially a wrapper for parallelisation around the :meth:`~musicflower.loader.load_file` function, which
     computes pitch scapes for a set of files.
@@ -182,35 +460,73 @@ def load_corpus(data: Iterable, n: int, parallel: bool = False, sort_func: calla
     :param n: resolution of pitch scape, i.e., the number of equally-sized time intervals to split the piece into
     :param parallel: parallelise loading
     :param sort_func: function that takes a file path and returns a key for sorting the result
+    :param return_colors: also return colours (see :meth:`~musicflower.plotting.key_colors`), which are computed for
+     the whole corpus at once; if caching is used, colours are cached as well (as 8 bit RGB, so the returned colours
+     are always quantised to 8 bit)
     :param kwargs: kwargs passed to the :meth:`~musicflower.loader.load_file` function (Note: this *has* to include
     :rtype: np.ndarray
     :return: array of shape (k, l, 12) where k is the number of files and :math:`l=n(n+1)/2` is the number of points in
-     a pitch scape of resolution :math:`n`.
+     a pitch scape of resolution :math:`n`; if **return_colors** is `True`, an array of shape (k, l, 3) with RGB colours
+     in [0, 1] is returned as second value.
     """
     # add resolution to kwargs
     kwargs['n'] = n
+    data = list(data)
+    if not data:
+        raise ValueError("'data' is empty; at least one file or audio data has to be provided")
+    # get the position of each file in the sorted output
+    order = sorted(range(len(data)), key=lambda idx: sort_func(data[idx]))
+    slots = np.empty(len(data), dtype=int)
+    slots[order] = np.arange(len(data))
+    # copy pitch scapes directly into the output array (allocated when the first result arrives)
+    final_array = None
+
+    def store(idx, scape):
+        nonlocal final_array
+        if final_array is None:
+            final_array = np.empty((len(data),) + scape.shape, dtype=scape.dtype)
+        final_array[slots[idx]] = scape
+
     # process in parallel or sequentially
     if parallel:
-        with Pool() as pool:
-            scape_list = []
-            for file_name, scape in tqdm(pool.istarmap(_parallel_load_file_wrapper, product(data, [kwargs])),
-                                         total=len(data)):
-                scape_list.append((file_name, scape[None]))
+        max_workers = os.cpu_count() or 1
+        if sys.platform == 'win32':
+            # ProcessPoolExecutor does not support more than 61 workers on Windows
+            max_workers = min(max_workers, 61)
+        # start with the largest files so that smaller files can fill up idle workers at the end
+        pending = iter(sorted(range(len(data)), key=lambda idx: _data_size(data[idx]), reverse=True))
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(kwargs,)) as executor, \
+                tqdm(total=len(data)) as progress:
+            # keep a limited number of tasks submitted and submit new ones as others finish
+            futures = {executor.submit(_parallel_load_file_wrapper, data[idx]): idx
+                       for idx in islice(pending, 2 * max_workers)}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store(futures.pop(future), future.result())
+                    progress.update()
+                futures.update({executor.submit(_parallel_load_file_wrapper, data[idx]): idx
+                                for idx in islice(pending, len(done))})
     else:
-        scape_list = []
-        for file_name in tqdm(data):
-            scape = load_file(data=file_name, **kwargs)
-            scape_list.append((file_name, scape[None]))
+        for idx, file_name in enumerate(tqdm(data)):
+            store(idx, load_file(data=file_name, **kwargs))
 
-    sorted_scape_list = sorted(scape_list, key=lambda x: sort_func(x[0]))
-    final_array = np.concatenate([x[1] for x in sorted_scape_list], axis=0)
-    data = [x[0] for x in sorted_scape_list]
+    data = [data[idx] for idx in order]
 
+    if return_colors:
+        colors = _corpus_colors(final_array, data, n=n,
+                                top_down=kwargs.get('top_down', True),
+                                use_cache=kwargs.get('use_cache', False),
+                                recompute_cache=kwargs.get('recompute_cache', False))
+        return final_array, colors / 255, data
     return final_array, data
 
 
 def get_chroma(data: Union[str, Tuple[np.ndarray, int]], cqt: bool = False, normal: bool = False, harm: bool = False,
-               filter: bool = False, smooth: bool = True, asdict: bool = False, loader=librosa.load, **kwargs
+               filter: bool = False, smooth: bool = True, asdict: bool = False,
+               loader=partial(librosa.load, res_type='soxr_mq'), **kwargs
                ) -> Union[Tuple[np.ndarray], Dict[str, np.ndarray], np.ndarray]:
     """
     Get chroma features from audio data.
@@ -225,17 +541,62 @@ def get_chroma(data: Union[str, Tuple[np.ndarray, int]], cqt: bool = False, norm
     :param filter: apply non-local filtering to chroma features
     :param smooth: apply a horizontal median filter (after non-local filtering)
     :param asdict: return results as a dict (keys are 'cqt', 'normal', 'harm', 'filter', 'smooth')
-    :param loader: the loader to use (defaults to librosa.load)
-    :param kwargs: kwargs passed to the cqt calls (librosa.cqt and/or librosa.feature.chroma_cqt)
-    :return: tuple, dict, or Numpy array with results (cqt/normal/harm/filter/smooth as specified)
+    :param loader: the loader to use (defaults to librosa.load with medium-quality resampling, which is faster and
+     sufficient for chroma features)
+    :param kwargs: kwargs passed to the cqt calls (librosa.cqt and/or librosa.feature.chroma_cqt), for instance,
+     a larger `hop_length` trades time resolution for speed
+    :return: tuple, dict, or Numpy array with results (cqt/normal/harm/filter/smooth as specified); results for files
+     are cached (as long as the file is not modified) and returned as read-only arrays
     """
-    # adapted from https://librosa.org/doc/main/auto_examples/plot_chroma.html
-    ret = []  # collect return values
-    # read file
+    features = dict(cqt=cqt, normal=normal, harm=harm, filter=filter, smooth=smooth)
     if isinstance(data, tuple):
         y, sr = data
+        ret = _compute_chroma(y=y, sr=sr, **features, **kwargs)
     else:
-        y, sr = loader(data)
+        cqt_kwargs = tuple(sorted(kwargs.items()))
+        try:
+            hash(cqt_kwargs)
+        except TypeError:
+            # cannot cache
+            y, sr = loader(data)
+            ret = _compute_chroma(y=y, sr=sr, **features, **kwargs)
+        else:
+            ret = _get_chroma_cached(data, os.stat(data).st_mtime_ns, loader, cqt_kwargs, **features)
+    # return
+    if asdict:
+        return dict(ret)
+    else:
+        if len(ret) == 1:
+            return ret[0][1]
+        else:
+            return tuple([x[1] for x in ret])
+
+
+@lru_cache(maxsize=8)
+def _get_chroma_cached(file_path, mtime, loader, cqt_kwargs, **features) -> Tuple[Tuple[str, np.ndarray], ...]:
+    """
+    Cached computation of chroma features for a file (see :func:`~musicflower.loader.get_chroma`). The modification
+    time is part of the cache key, so modified files are reloaded. The returned arrays are read-only. Note that this
+    keeps the feature sets of up to eight files alive per process (including full CQT matrices if `cqt=True`), which
+    is only useful if the same files are loaded repeatedly (e.g. interactively); in the worker processes of
+    :meth:`~musicflower.loader.load_corpus` each file is loaded only once.
+    """
+    y, sr = loader(file_path)
+    ret = _compute_chroma(y=y, sr=sr, **features, **dict(cqt_kwargs))
+    for _, arr in ret:
+        arr.flags.writeable = False
+    return tuple(ret)
+
+
+def _compute_chroma(y: np.ndarray, sr: int, cqt: bool, normal: bool, harm: bool, filter: bool, smooth: bool,
+                    **kwargs) -> list:
+    """
+    Compute chroma features from audio (see :func:`~musicflower.loader.get_chroma`).
+
+    :return: list of (name, value) tuples
+    """
+    # adapted from https://librosa.org/doc/main/auto_examples/plot_chroma.html
+    ret = []  # collect return values
     # CQT matrix
     if cqt:
         ret.append(('cqt', np.abs(librosa.cqt(y=y, sr=sr, bins_per_octave=12 * 3, n_bins=7 * 12 * 3, **kwargs))))
@@ -260,14 +621,7 @@ def get_chroma(data: Union[str, Tuple[np.ndarray, int]], cqt: bool = False, norm
             # horizontal median filter
             if smooth:
                 ret.append(('smooth', scipy.ndimage.median_filter(chroma_filter, size=(1, 9))))
-    # return
-    if asdict:
-        return dict(ret)
-    else:
-        if len(ret) == 1:
-            return ret[0][1]
-        else:
-            return tuple([x[1] for x in ret])
+    return ret
 
 
 def plot_chroma_comparison(file_name, start, end):
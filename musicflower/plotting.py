@@ -3,8 +3,11 @@
 from typing import List, Union, Iterable
 from numbers import Integral
 from itertools import repeat
+from functools import lru_cache
 
 import numpy as np
+from scipy.special import xlogy
+from numba import njit
 
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
@@ -22,6 +25,18 @@ from musicflower.util import get_time_traces, surface_scape_indices, assert_vali
 # use colouring along circle of fifths (not chromatic)
 pt.set_circle_of_fifths(True)
 
+# key estimator used for colouring
+_KEY_ESTIMATOR = KeyEstimator()
+# normalised profiles in all transpositions as (12, 24) matrix (major/minor x transposition along second dimension)
+_KEY_PROFILES = _KEY_ESTIMATOR.profiles / _KEY_ESTIMATOR.profiles.sum(axis=1, keepdims=True)
+_KEY_PROFILES = np.stack([np.roll(_KEY_PROFILES, roll_idx, axis=1) for roll_idx in range(12)], axis=1)
+_KEY_PROFILES = _KEY_PROFILES.reshape(24, 12).T.copy()
+# (24, 3) table with RGB colours of all keys (same order as the columns of _KEY_PROFILES)
+_KEY_COLORS_RGB = np.concatenate([pt.get_key_colour(tonic_pitch=np.arange(12), maj_min=maj_min, circle_of_fifths=True)
+                                  for maj_min in (0, 1)])
+# softmax temperature used for weighting the key colours (same default as pitchscapes.plotting.key_scores_to_color)
+_KEY_COLORS_TEMPERATURE = 0.005
+
 
 def rgba(*args):
     if len(args) == 1:
@@ -59,6 +74,45 @@ def rgba_darker(col, val):
     return rgba_mix([col, np.zeros_like(col)], [1 - val, val])
 
 
+# not parallel (see musicflower.loader._build_scape); numpy error model and fastmath without the 'nnan' and 'ninf'
+# flags, so that zero PCDs result in NaN scores
+@njit(fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, error_model='numpy', cache=True)
+def _key_distances(pcds: np.ndarray, profiles: np.ndarray) -> np.ndarray:
+    """
+    Compute the Euclidean distances between normalised PCDs and key profiles.
+
+    :param pcds: array of shape (N, 12) with (unnormalised) PCDs
+    :param profiles: array of shape (12, K) with normalised key profiles
+    :return: array of shape (N, K) with distances
+    """
+    out = np.empty((pcds.shape[0], profiles.shape[1]))
+    for idx in range(pcds.shape[0]):
+        total = 0.
+        for c in range(pcds.shape[1]):
+            total += pcds[idx, c]
+        for key in range(profiles.shape[1]):
+            squared_dist = 0.
+            for c in range(pcds.shape[1]):
+                diff = pcds[idx, c] / total - profiles[c, key]
+                squared_dist += diff * diff
+            out[idx, key] = np.sqrt(squared_dist)
+    return out
+
+
+def key_scores(pcds: np.ndarray) -> np.ndarray:
+    """
+    Compute the same scores as :meth:`KeyEstimator.get_score` (Euclidean distance between normalised PCDs and key
+    profiles) in a single compiled loop over the precomputed key profiles.
+
+    :param pcds: array of shape (N, 12)
+    :return: array of shape (N, 2, 12) with scores for major/minor profiles in all transpositions
+    """
+    pcds = np.asarray(pcds)
+    # single precision PCDs (e.g. from pitch scapes) are used directly; other types are converted
+    pcds = np.ascontiguousarray(pcds, dtype=pcds.dtype if pcds.dtype == np.float32 else float)
+    return _key_distances(pcds, _KEY_PROFILES).reshape(-1, 2, 12)
+
+
 def key_colors(pcds: np.ndarray, alpha=False) -> np.ndarray:
     """
     Given an array of PCDs, returns a corresponding array of RGB or RGBA colors.
@@ -68,20 +122,34 @@ def key_colors(pcds: np.ndarray, alpha=False) -> np.ndarray:
     :return: array of shape (..., 3) or (..., 4) with RGB/RGBA colors
     """
     assert pcds.shape[-1] == 12, f"last dimension of 'pcds' must be of size 12 but is of size {pcds.shape[-1]}"
-    # reshape if necessary
     shape = pcds.shape
-    if len(shape) > 2:
-        pcds = pcds.reshape(-1, 12)
-    # get scores and colours
-    k = KeyEstimator()
-    scores = k.get_score(pcds)
-    colors = pt.key_scores_to_color(scores, circle_of_fifths=True)
-    # remove alpha if requested
-    if not alpha:
-        colors = colors[:, :3]
-    # reshape back if necessary
-    if len(shape) > 2:
-        colors = colors.reshape(shape[:-1] + (colors.shape[-1],))
+    # get scores and convert to weights via softmax in place (equivalent to pitchscapes.plotting.key_scores_to_color)
+    weights = key_scores(pcds.reshape(-1, 12)).reshape(-1, 24)
+    weights *= -1 / _KEY_COLORS_TEMPERATURE
+    weights -= weights.max(axis=1, keepdims=True)
+    np.exp(weights, out=weights)
+    weights /= weights.sum(axis=1, keepdims=True)
+    is_nan = np.isnan(weights).any(axis=1)
+    weights[is_nan] = 0
+    # colours as weighted average of key colours (and alpha from normalised entropy if requested)
+    colors = np.empty((weights.shape[0], 4 if alpha else 3))
+    colors[:, :3] = weights @ _KEY_COLORS_RGB
+    if alpha:
+        entropy = -xlogy(weights, weights).sum(axis=1) / np.log(24)
+        colors[:, 3] = (1 - entropy) ** 2
+        colors[is_nan, 3] = 0
+    # rounding errors in the softmax may lead to values slightly outside [0, 1]
+    np.clip(colors, 0, 1, out=colors)
+    return colors.reshape(shape[:-1] + (colors.shape[-1],))
+
+
+def _compact_colors(colors):
+    """
+    Convert colour arrays to single precision, which halves the size of the figure data sent to the browser (other
+    colour specifications, such as strings, are returned unchanged).
+    """
+    if isinstance(colors, np.ndarray):
+        return colors.astype(np.float32, copy=False)
     return colors
 
 
@@ -180,7 +248,7 @@ def plot_points(x, y, z, colors, name=None, groupname=None, group=None, marker_k
         name = "points"
     if name is False:
         name = None
-    marker_kwargs = {**dict(color=colors, opacity=1, line=dict(width=0), size=0.3), **dict(marker_kwargs)}
+    marker_kwargs = {**dict(color=_compact_colors(colors), opacity=1, line=dict(width=0), size=0.3), **dict(marker_kwargs)}
     trace = go.Scatter3d(x=x, y=y, z=z,
                          mode='markers', marker=marker_kwargs,
                          **grouplegend_kwargs(group, groupname, name),
@@ -196,6 +264,8 @@ def plot_tip(x, y, z, colors, name=None, groupname=None, group=None):
     kwargs = grouplegend_kwargs(group, groupname, name)
     if group:
         kwargs = {**dict(hovertemplate=group + "<extra></extra>"), **kwargs}
+    if isinstance(colors, np.ndarray):
+        colors = _compact_colors(colors[:1])
     trace = go.Scatter3d(x=x[:1], y=y[:1], z=z[:1],
                          mode='markers', marker=dict(color=colors, opacity=1, line=dict(width=0), size=5),
                          **kwargs)
@@ -208,7 +278,7 @@ def plot_surface(x, y, z, colors, name=None, groupname=None, group=None, **kwarg
     if name is False:
         name = None
     kwargs = {**grouplegend_kwargs(group, groupname, name),
-              **dict(vertexcolor=colors, opacity=0.2, hoverinfo='skip'),
+              **dict(vertexcolor=_compact_colors(colors), opacity=0.2, hoverinfo='skip'),
               **kwargs}
     if group:
         kwargs = {**dict(hovertemplate=group + "<extra></extra>"), **kwargs}
@@ -217,21 +287,31 @@ def plot_surface(x, y, z, colors, name=None, groupname=None, group=None, **kwarg
     return trace
 
 
+@lru_cache(maxsize=32)
+def _border_indices(n: int) -> np.ndarray:
+    """
+    Return (read-only) indices of the points along the border of a triangular map of resolution *n*: from the tip along
+    the left edge, along the right edge, and back along the bottom.
+
+    :param n: resolution of the triangular map
+    :return: index array
+    """
+    index_map = TMap(np.arange(TMap.size_from_n(n)))
+    idx = np.concatenate([index_map.sslice[0], index_map.eslice[n], np.flip(index_map.lslice[1])])
+    idx.flags.writeable = False
+    return idx
+
+
 def plot_border(x, y, z, colors, name=None, groupname=None, group=None, **kwargs):
     if name is True:
         name = "border"
     if name is False:
         name = None
-    n = TMap.n_from_size(colors.shape[0])
+    idx = _border_indices(TMap.n_from_size(colors.shape[0]))
     kwargs = {**grouplegend_kwargs(group, groupname, name),
-              **dict(hoverinfo='skip', mode='lines', line_color=np.concatenate([TMap(colors).sslice[0],
-                                                                                TMap(colors).eslice[n],
-                                                                                TMap(colors).lslice[1]])),
+              **dict(hoverinfo='skip', mode='lines', line_color=_compact_colors(colors[idx])),
               **kwargs}
-    trace = go.Scatter3d(x=np.concatenate([TMap(x).sslice[0], TMap(x).eslice[n], np.flip(TMap(x).lslice[1])]),
-                         y=np.concatenate([TMap(y).sslice[0], TMap(y).eslice[n], np.flip(TMap(y).lslice[1])]),
-                         z=np.concatenate([TMap(z).sslice[0], TMap(z).eslice[n], np.flip(TMap(z).lslice[1])]),
-                         **kwargs)
+    trace = go.Scatter3d(x=x[idx], y=y[idx], z=z[idx], **kwargs)
     return trace
 
 
@@ -255,7 +335,6 @@ def plot_time_traces(x: np.ndarray, y: np.ndarray, z: np.ndarray, colors: np.nda
     :return: a list of `n_steps` + 1 Plotly :class:`Scatter3d` plots
     """
     xyz_traces, colors_traces = get_time_traces(x=x, y=y, z=z, colors=colors, n_steps=n_steps, times=times)
-    time_trace_plots = []
     kwargs = {**dict(showlegend=False,
                      mode='lines',
                      line_width=4,
@@ -263,14 +342,11 @@ def plot_time_traces(x: np.ndarray, y: np.ndarray, z: np.ndarray, colors: np.nda
               **kwargs}
     if group is not None:
         kwargs = {**dict(legendgroup=group), **kwargs}
-    for xyz, colors in zip(xyz_traces, colors_traces):
-        frame = go.Scatter3d(x=xyz[:, 0],
-                             y=xyz[:, 1],
-                             z=xyz[:, 2],
-                             line_color=colors,
-                             **kwargs)
-        time_trace_plots.append(frame)
-    return time_trace_plots
+    # separate coordinates once (views, no copies)
+    xs, ys, zs = xyz_traces[..., 0], xyz_traces[..., 1], xyz_traces[..., 2]
+    colors_traces = _compact_colors(colors_traces)
+    return [go.Scatter3d(x=xs[i], y=ys[i], z=zs[i], line_color=colors_traces[i], **kwargs)
+            for i in range(xyz_traces.shape[0])]
 
 
 def add_time_slider(frame_traces, fig):
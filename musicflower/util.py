@@ -2,10 +2,10 @@
 
 from typing import Union, Tuple
 from itertools import repeat
+from functools import lru_cache
 import math
 
 import numpy as np
-from scipy import interpolate
 import matplotlib.pyplot as plt
 
 from triangularmap import TMap
@@ -143,26 +143,24 @@ def get_time_traces(x: np.ndarray, y: np.ndarray, z: np.ndarray, colors: np.ndar
         n_steps = len(times) - 1
     if times is None:
         times = np.linspace(0, 1, n_steps + 1)
+    times = np.asarray(times, dtype=float)
     xyz = np.concatenate([x[..., None], y[..., None], z[..., None]], axis=-1)
     if axis != 0:
         xyz = np.moveaxis(xyz, axis, 0)
         colors = np.moveaxis(colors, axis, 0)
-    batch_shape = xyz.shape[1:-1]
-    xyz = TMap(xyz)
-    colors = TMap(colors)
-    n = colors.n
-    xyz_out = np.zeros((n_steps + 1, n) + batch_shape + (3,))
-    colors_out = np.ones((n_steps + 1, n) + batch_shape + (3,))
-    for depth in range(n):
-        for arr, arr_out in [(xyz, xyz_out), (colors, colors_out)]:
-            # for i in range(3):
-            if depth == 0:
-                arr_out[:, depth, ..., :] = arr.dslice[depth][0, ..., :]
-            else:
-                arr_out[:, depth, ..., :] = interpolate.interp1d(np.linspace(0, 1, depth + 1),
-                                                              arr.dslice[depth][..., :],
-                                                              axis=0,
-                                                              copy=False)(times)
+    size = xyz.shape[0]
+    n = TMap.n_from_size(size)
+    # for all times and rows (depths), get the (linear) indices of the two points to interpolate between and the
+    # interpolation weight for the second point
+    depth = np.arange(n)
+    pos = times[:, None] * depth[None, :]
+    left = np.minimum(np.floor(pos), np.maximum(depth - 1, 0)).astype(int)
+    weight = pos - left
+    left += depth * (depth + 1) // 2
+    right = np.minimum(left + 1, size - 1)
+    weight = weight.reshape(weight.shape + (1,) * (len(xyz.shape) - 1))
+    xyz_out = (1 - weight) * xyz[left] + weight * xyz[right]
+    colors_out = (1 - weight) * colors[left] + weight * colors[right]
     return xyz_out, colors_out
 
 
@@ -227,13 +225,21 @@ def surface_scape_indices(n: Union[int, np.ndarray], axis: int = None) -> Tuple[
      corresponds to the triangular map)
     :param axis: if `n` is an array, `axis` has to be provided to specify the dimension corresponding to the triangular
      map
-    :return: i, j, k
+    :return: i, j, k (read-only arrays, which are cached for each resolution)
     """
     # get size from array
     if isinstance(n, np.ndarray):
         if axis is None:
             raise TypeError(f"If an array is provided for 'n', 'axis' has to be specified, too.")
         n = TMap.n_from_size(n.shape[axis])
+    return _surface_scape_indices(int(n))
+
+
+@lru_cache(maxsize=32)
+def _surface_scape_indices(n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cached implementation of :func:`~musicflower.util.surface_scape_indices` for resolution `n`.
+    """
     # get TMap of point indices
     index_map = TMap(np.arange(TMap.size_from_n(n)))
     # iterate through rows and construct triangles
@@ -255,6 +261,9 @@ def surface_scape_indices(n: Union[int, np.ndarray], axis: int = None) -> Tuple[
     assert i.shape == j.shape == k.shape and len(i) == (n - 1) ** 2, \
         f"i, j, k should have length {(n - 1) ** 2} but have shape {i.shape}, {j.shape}, {k.shape}. " \
         f"This is a bug in the code."
+    i, j, k = i.astype(np.int32), j.astype(np.int32), k.astype(np.int32)
+    for arr in (i, j, k):
+        arr.flags.writeable = False
     return i, j, k
 
 
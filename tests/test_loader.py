@@ -2,11 +2,19 @@
 
 import unittest
 import pathlib
+import pickle
+import json
+import os
+import shutil
+import tempfile
 
 import librosa
-from numpy.testing import assert_array_equal
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+from triangularmap import TMap
 
-from musicflower.loader import load_corpus
+from musicflower.loader import load_file, load_corpus, audio_scape, get_chroma, get_cache_file_path, \
+    _scape_start_end, _get_chroma_cached
 
 
 class MyTestCase(unittest.TestCase):
@@ -15,6 +23,89 @@ class MyTestCase(unittest.TestCase):
         file_path = pathlib.Path(__file__).parent.resolve() / "Prelude_No._1_BWV_846_in_C_Major.ogg"
         corpus, file_names = load_corpus(data=[file_path, file_path], n=10, use_cache=True, recompute_cache=True)
         corpus, file_names = load_corpus(data=[file_path, file_path], n=10, use_cache=True, recompute_cache=False)
-        y, sr = librosa.load(file_path)
+        y, sr = librosa.load(file_path, res_type='soxr_mq')  # same as default loader in get_chroma
         corpus_, file_names_ = load_corpus(data=[(y, sr), (y, sr)], n=10)
         assert_array_equal(corpus, corpus_)
+        # colours (computed, cached, and without cache)
+        for top_down in [True, False]:
+            colors = [load_corpus(data=[file_path, file_path], n=10, use_cache=True, top_down=top_down,
+                                  return_colors=True)[1] for _ in range(2)]
+            colors.append(load_corpus(data=[(y, sr), (y, sr)], n=10, top_down=top_down, return_colors=True)[1])
+            for c in colors:
+                assert_array_equal(colors[0], c)
+        # empty input
+        self.assertRaises(ValueError, load_corpus, data=[], n=10)
+
+    def test_cache(self):
+        file_path = pathlib.Path(__file__).parent.resolve() / "Prelude_No._1_BWV_846_in_C_Major.ogg"
+        # kwargs that cannot be stored as JSON fall back to the pickle format
+        scape = load_file(file_path, n=10, use_cache=True, recompute_cache=True, loader=librosa.load)
+        self.assertTrue(get_cache_file_path(file_path, 10, extension=".pickle").exists())
+        self.assertFalse(get_cache_file_path(file_path, 10).exists())
+        assert_array_equal(scape, load_file(file_path, n=10, use_cache=True, loader=librosa.load))
+        self.assertRaises(ValueError, load_file, file_path, n=10, use_cache=True)
+        # .npy cache without metadata (e.g. from an interrupted write) is ignored
+        scape = load_file(file_path, n=10, use_cache=True, recompute_cache=True)
+        get_cache_file_path(file_path, 10, extension=".json").unlink()
+        assert_array_equal(scape, load_file(file_path, n=10, use_cache=True))
+        self.assertTrue(get_cache_file_path(file_path, 10, extension=".json").exists())
+        # metadata without the required keys is ignored
+        with open(get_cache_file_path(file_path, 10, extension=".json"), 'w') as meta_file:
+            json.dump(dict(kwargs=dict(normalise=True)), meta_file)
+        assert_array_equal(scape, load_file(file_path, n=10, use_cache=True))
+        # recomputing the cache does not change previously loaded (memory-mapped) pitch scapes
+        scape = load_file(file_path, n=10, use_cache=True)
+        scape_copy = np.array(scape)
+        unnormalised = load_file(file_path, n=10, use_cache=True, recompute_cache=True, normalise=False)
+        self.assertFalse(np.allclose(scape_copy, unnormalised))
+        assert_array_equal(scape_copy, scape)
+        assert_array_equal(unnormalised, load_file(file_path, n=10, use_cache=True, normalise=False))
+        # legacy pickle files (without ordering flag and in double precision)
+        get_cache_file_path(file_path, 10).unlink()
+        legacy_scape = np.random.uniform(0, 1, (TMap.size_from_n(10), 12))
+        with open(get_cache_file_path(file_path, 10, extension=".pickle"), 'wb') as cache_file:
+            pickle.dump((legacy_scape, dict(normalise=True)), cache_file)
+        scape = load_file(file_path, n=10, use_cache=True, top_down=False)
+        self.assertEqual(scape.dtype, np.float32)
+        assert_allclose(legacy_scape, scape, rtol=1e-6)
+
+    def test_get_chroma_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = shutil.copy(pathlib.Path(__file__).parent.resolve() / "Prelude_No._1_BWV_846_in_C_Major.ogg",
+                                    tmp_dir)
+            # repeated calls hit the cache and return read-only arrays
+            chroma = get_chroma(file_path)
+            hits = _get_chroma_cached.cache_info().hits
+            self.assertIs(chroma, get_chroma(file_path))
+            self.assertEqual(_get_chroma_cached.cache_info().hits, hits + 1)
+            self.assertFalse(chroma.flags.writeable)
+            self.assertRaises(ValueError, chroma.fill, 0)
+            # modified files are recomputed
+            stat = os.stat(file_path)
+            os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            recomputed = get_chroma(file_path)
+            self.assertIsNot(chroma, recomputed)
+            self.assertEqual(_get_chroma_cached.cache_info().hits, hits + 1)
+            assert_array_equal(chroma, recomputed)
+
+    def test_audio_scape(self):
+        for n_bins, n in [(50, 10), (10, 10), (7, 10), (1, 3)]:
+            raw_chroma = np.random.uniform(0, 1, (12, n_bins))
+            # naive reference: sum raw chroma over the time span of each point
+            bounds = [int(round(idx / n * n_bins)) for idx in range(n + 1)]
+            scape = TMap(np.zeros((TMap.size_from_n(n), 12)))
+            for start in range(n):
+                for end in range(start + 1, n + 1):
+                    scape[start, end] = raw_chroma[:, bounds[start]:bounds[end]].sum(axis=1)
+            for top_down in [True, False]:
+                reference = scape.arr if top_down else TMap.reindex_from_top_down_to_start_end(scape.arr)
+                result = audio_scape(n, raw_chroma=raw_chroma, normalise=False, top_down=top_down)
+                self.assertEqual(result.dtype, np.float32)
+                assert_allclose(reference, result, rtol=1e-6)
+
+    def test_scape_start_end(self):
+        for n in [1, 2, 5]:
+            for top_down, reindex in [(True, lambda x: x), (False, TMap.reindex_from_top_down_to_start_end)]:
+                starts, ends = _scape_start_end(n, top_down=top_down)
+                tmap = TMap(np.arange(TMap.size_from_n(n)))
+                assert_array_equal(reindex(tmap.arr), tmap[starts, ends])
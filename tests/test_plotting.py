@@ -3,9 +3,13 @@
 from unittest import TestCase
 
 import numpy as np
-from numpy.testing import assert_array_equal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+from pitchscapes.keyfinding import KeyEstimator
+import pitchscapes.plotting as pt
+from triangularmap import TMap
 
-from musicflower.util import trisurf
+from musicflower.util import trisurf, get_time_traces
+from musicflower.plotting import key_scores, key_colors
 
 
 class TestPlotting(TestCase):
@@ -30,3 +34,36 @@ class TestPlotting(TestCase):
         new_indices = np.concatenate([i[:, None], j[:, None], k[:, None]], axis=1)
         self.assertFalse(np.array_equal(indices, new_indices))  # because some original indices refer to duplicates
         assert_array_equal(indices % N, new_indices)  # taking modulo maps to first (unique) occurrence
+
+    def test_key_scores(self):
+        pcds = np.random.uniform(0, 1, (100, 12))
+        pcds[0] = 0  # zero PCD results in NaN scores
+        assert_array_almost_equal(KeyEstimator().get_score(pcds), key_scores(pcds))
+
+    def test_get_time_traces(self):
+        n = 10
+        x, y, z = np.random.uniform(0, 1, (3, TMap.size_from_n(n)))
+        colors = np.random.uniform(0, 1, (TMap.size_from_n(n), 3))
+        xyz_traces, colors_traces = get_time_traces(x=x, y=y, z=z, colors=colors, n_steps=4)
+        self.assertEqual(xyz_traces.shape, (5, n, 3))
+        self.assertEqual(colors_traces.shape, (5, n, 3))
+        # first/last trace runs (top-down) along left/right border of the triangular map
+        xyz = np.stack([x, y, z], axis=-1)
+        for trace, arr in [(xyz_traces, xyz), (colors_traces, colors)]:
+            assert_array_almost_equal(trace[0], np.flip(TMap(arr).sslice[0], axis=0))
+            assert_array_almost_equal(trace[-1], TMap(arr).eslice[n])
+            # middle trace interpolates the middle of each row
+            assert_array_almost_equal(trace[2], [TMap(arr).dslice[d][[d // 2, (d + 1) // 2]].mean(axis=0)
+                                                 for d in range(n)])
+        # explicit times (also as list)
+        xyz_times, colors_times = get_time_traces(x=x, y=y, z=z, colors=colors, times=[0.5])
+        assert_array_almost_equal(xyz_times[0], xyz_traces[2])
+        assert_array_almost_equal(colors_times[0], colors_traces[2])
+
+    def test_key_colors(self):
+        pcds = np.random.uniform(0, 1, (100, 12))
+        pcds[0] = 0  # zero PCD results in transparent black
+        reference = pt.key_scores_to_color(KeyEstimator().get_score(pcds), circle_of_fifths=True)
+        assert_array_almost_equal(reference, key_colors(pcds, alpha=True))
+        assert_array_almost_equal(reference[:, :3], key_colors(pcds))
+        assert_array_almost_equal(reference.reshape(10, 10, 4), key_colors(pcds.reshape(10, 10, 12), alpha=True))